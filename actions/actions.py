@@ -27,6 +27,7 @@ sys.path.append("lib")
 import charms.reactive  # noqa: E402
 from charms.layer import basic  # noqa: E402
 from charms.reactive.flags import clear_flag  # noqa: E402
+from lib_openstack_service_checks import OSCHelper  # noqa: E402
 
 basic.bootstrap_charm_deps()
 basic.init_config_states()
@@ -38,6 +39,7 @@ def refresh_endpoint_checks(*args):
     Ensures next time update-status runs, the Keystone catalog is re-read
     and nrpe checks refreshed.
     """
+    OSCHelper().clear_keystone_catalog_cache()
     clear_flag("openstack-service-checks.endpoints.configured")
 
 
@@ -6,7 +6,10 @@
 #   Robert Gildein <robert.gildein@canonical.com>
 """Define nagios checks for OpenStack resources."""
 import argparse
+import functools
+import itertools
 import logging
+import operator
 import os
 import subprocess
 from typing import Dict, List
@@ -14,6 +17,12 @@ from typing import Dict, List
 from nagios_plugin3 import CriticalError, UnknownError, WarnError, try_check
 
 import openstack
+from openstack.compute.v2.server import Server
+from openstack.network.v2.floating_ip import FloatingIP
+from openstack.network.v2.network import Network
+from openstack.network.v2.port import Port
+from openstack.network.v2.security_group import SecurityGroup
+from openstack.network.v2.subnet import Subnet
 
 
 APP = os.path.splitext(os.path.basename(__file__))[0]
@@ -24,6 +33,10 @@ SKIP_MESSAGE = "{} skipped"
 WARNING_MESSAGE = "{}/{} in UNKNOWN"
 DOWN_MESSAGE = "{}/{} are DOWN"
 NOT_FOUND_MESSAGE = "{}/{} were not found"
+RESULT_STATUS_MESSAGE = "{} '{}' is in {} status"
+RESULT_SKIP_MESSAGE = "{} '{}' skip"
+RESULT_NOT_FOUND_MESSAGE = "{} '{}' was not found"
+RESULT_EXISTS_MESSAGE = "{} '{}' exists"
 NAGIOS_STATUS_OK = 0
 NAGIOS_STATUS_WARNING = 1
 NAGIOS_STATUS_CRITICAL = 2
@@ -34,26 +47,108 @@ NAGIOS_STATUS = {
     NAGIOS_STATUS_CRITICAL: "CRITICAL",
     NAGIOS_STATUS_UNKNOWN: "UNKNOWN",
 }
+# resource status: (results group, nagios status)
+RESULT_BY_STATUS = {
+    "ACTIVE": ("ok", NAGIOS_STATUS_OK),
+    "DOWN": ("critical", NAGIOS_STATUS_CRITICAL),
+}
 # NOTE (rgildein): If there is any change in this list or the list below, it is
 # necessary to modify lists in lib_openstack_service_checks.OSCHelper.render_checks
 RESOURCES = {
-    "network": lambda conn: conn.network.networks(),
-    "floating-ip": lambda conn: conn.network.ips(),
-    "server": lambda conn: conn.compute.servers(),
-    "port": lambda conn: conn.network.ports(),
-    "security-group": lambda conn: conn.network.security_groups(),
-    "subnet": lambda conn: conn.network.subnets(),
+    "network": lambda conn, ids=None, select=None: _fetch(
+        conn.network.networks, Network, ids, select, fields=["id"]
+    ),
+    "floating-ip": lambda conn, ids=None, select=None: _fetch(
+        conn.network.ips, FloatingIP, ids, select, fields=["id", "status"]
+    ),
+    # NOTE: Nova does not support limiting the fields or filtering listed servers by IDs
+    "server": lambda conn, ids=None, select=None: _fetch(
+        conn.compute.servers, Server, select=select
+    ),
+    "port": lambda conn, ids=None, select=None: _fetch(
+        conn.network.ports,
+        Port,
+        ids,
+        select,
+        fields=["id", "status", "device_id", "binding:vif_type"],
+    ),
+    "security-group": lambda conn, ids=None, select=None: _fetch(
+        conn.network.security_groups, SecurityGroup, ids, select, fields=["id"]
+    ),
+    "subnet": lambda conn, ids=None, select=None: _fetch(
+        conn.network.subnets, Subnet, ids, select, fields=["id"]
+    ),
 }
 
 FLOATING_IP_RESOURCES = {
-    "unassigned": lambda conn: conn.network.ips(fixed_ip_address=None, status="DOWN")
+    "unassigned": lambda conn: conn.network.ips(
+        fixed_ip_address=None, status="DOWN", **_supported_query(FloatingIP, fields=["id"])
+    )
 }
 
 PORT_RESOURCES = {
-    "network:dhcp": lambda conn: conn.network.ports(device_owner="network:dhcp"),
-    "network:distributed": lambda conn: conn.network.ports(device_owner="network:distributed"),
+    "network:dhcp": lambda conn: conn.network.ports(
+        device_owner="network:dhcp", **_supported_query(Port, fields=["id"])
+    ),
+    "network:distributed": lambda conn: conn.network.ports(
+        device_owner="network:distributed", **_supported_query(Port, fields=["id"])
+    ),
 }
 RESOURCES_BY_EXISTENCE = ["security-group", "subnet", "network"]
+# maximum number of IDs requested by a single list call, so the request line stays short
+ID_FILTER_BATCH_SIZE = 50
+
+
+def _supported_query(resource_cls, **query):
+    """Drop query parameters that the installed OpenStack SDK does not support.
+
+    Older SDKs (e.g. from Ubuntu 20.04 or 22.04) raise `InvalidResourceQuery` for
+    unknown query parameters, such as `fields` for networks.
+    """
+    mapping = resource_cls._query_mapping._mapping
+    unsupported = query.keys() - mapping.keys()
+    if unsupported:
+        logger.debug("%s does not support query %s", resource_cls.__name__, unsupported)
+
+    return {key: value for key, value in query.items() if key in mapping}
+
+
+def _fetch(list_resources, resource_cls, ids=None, select=None, fields=None):
+    """Fetch OpenStack resources with filtering done on the server side.
+
+    The `select` values and IDs are passed as query parameters if the resource supports
+    them, IDs are requested in batches of `ID_FILTER_BATCH_SIZE`. Listed resources are
+    limited to `fields`, unless `select` is used, since resources are always filtered
+    by IDs and `select` values also on the client side.
+
+    :param list_resources: SDK method to list resources, e.g. `conn.network.ports`
+    :type list_resources: Callable
+    :param resource_cls: SDK resource class, e.g. `openstack.network.v2.port.Port`
+    :type resource_cls: Type[openstack.resource.Resource]
+    :param ids: OpenStack resource IDs that will be checked
+    :type ids: Optional[Set[str]]
+    :param select: values for OpenStack resources filtering
+    :type select: Optional[Dict[str, str]]
+    :param fields: resource fields returned by the API, e.g. ["id", "status"]
+    :type fields: Optional[List[str]]
+    :returns: A generator of OpenStack objects
+    :rtype: Generator
+    """
+    if select:
+        query = _supported_query(resource_cls, **select)
+    elif fields:
+        query = _supported_query(resource_cls, fields=fields)
+    else:
+        query = {}
+
+    if ids and "id" in resource_cls._query_mapping._mapping:
+        ids = iter(sorted(ids))
+        batches = iter(lambda: list(itertools.islice(ids, ID_FILTER_BATCH_SIZE)), [])
+        return itertools.chain.from_iterable(
+            list_resources(id=batch, **query) for batch in batches
+        )
+
+    return list_resources(**query)
 
 
 class Results:
@@ -68,10 +163,16 @@ class Results:
         self.not_found = []
         self.skipped = []
         self._messages = []
+        self._sorted_messages = None
 
     @property
     def messages(self):
-        return [message for _, message in sorted(self._messages, reverse=True)]
+        if self._sorted_messages is None:
+            self._sorted_messages = [
+                message for _, message in sorted(self._messages, reverse=True)
+            ]
+
+        return self._sorted_messages
 
     @property
     def count(self):
@@ -81,41 +182,59 @@ class Results:
         group.append(id_)
         self.exit_code = max(exit_code, self.exit_code)
         self._messages.append((exit_code, msg))
+        self._sorted_messages = None
         logger.debug("result was added with (%s, %s)", exit_code, msg)
 
     def add_result(self, type_, id_, status=None, exists=True, skip=False, warn=False):
         # Force result
         if skip:
-            msg = "{} '{}' skip".format(type_, id_)
+            msg = RESULT_SKIP_MESSAGE.format(type_, id_)
             self._add_result(id_, self.skipped, NAGIOS_STATUS_OK, msg)
         elif warn:
-            msg = "{} '{}' is in {} status".format(type_, id_, status)
+            msg = RESULT_STATUS_MESSAGE.format(type_, id_, status)
             self._add_result(id_, self.warning, NAGIOS_STATUS_WARNING, msg)
         # Request resource id not exists
         elif not exists:
-            msg = "{} '{}' was not found".format(type_, id_)
+            msg = RESULT_NOT_FOUND_MESSAGE.format(type_, id_)
             self._add_result(id_, self.not_found, NAGIOS_STATUS_CRITICAL, msg)
-
-        # Base on status
-
-        # Active
-        elif status == "ACTIVE":
-            msg = "{} '{}' is in {} status".format(type_, id_, status)
-            self._add_result(id_, self.ok, NAGIOS_STATUS_OK, msg)
-        # Down
-        elif status == "DOWN":
-            msg = "{} '{}' is in {} status".format(type_, id_, status)
-            self._add_result(id_, self.critical, NAGIOS_STATUS_CRITICAL, msg)
+        # Base on status, e.g. ACTIVE, DOWN
+        elif status in RESULT_BY_STATUS:
+            group, exit_code = RESULT_BY_STATUS[status]
+            msg = RESULT_STATUS_MESSAGE.format(type_, id_, status)
+            self._add_result(id_, getattr(self, group), exit_code, msg)
         # Specific existence resource
-        elif not status and exists and type_ in RESOURCES_BY_EXISTENCE:
-            msg = "{} '{}' exists".format(type_, id_)
+        elif not status and type_ in RESOURCES_BY_EXISTENCE:
+            msg = RESULT_EXISTS_MESSAGE.format(type_, id_)
             self._add_result(id_, self.ok, NAGIOS_STATUS_OK, msg)
         # UNKNOWN status
         else:
-            msg = "{} '{}' is in {} status".format(type_, id_, status)
+            msg = RESULT_STATUS_MESSAGE.format(type_, id_, status)
             self._add_result(id_, self.warning, NAGIOS_STATUS_WARNING, msg)
 
 
+def _select_predicate(select):
+    """Create function to check if resource matches all `--select` values.
+
+    :param select: values for OpenStack resources filtering
+    :type select: Optional[Dict[str, str]]
+    :returns: predicate or None if there is nothing to select
+    :rtype: Optional[Callable[[Any], bool]]
+    """
+    if not select:
+        return None
+
+    getter = operator.attrgetter(*select)
+    expected = operator.itemgetter(*select)(select)
+
+    def _selected(resource):
+        try:
+            return getter(resource) == expected
+        except AttributeError:
+            return False
+
+    return _selected
+
+
 def _resource_filter(resources, ids, skip, check_all, select):
     """Apply `--skip` and `--select` parameter to resources.
 
@@ -132,21 +251,25 @@ def _resource_filter(resources, ids, skip, check_all, select):
     :returns: A generator of OpenStack objects
     :rtype: Generator
     """
-    skip = skip or {}
+    ids = frozenset(ids)
+    skip = frozenset(skip or ())
+    selected = _select_predicate(select) if check_all else None
+    # avoid logger calls for each resource if debug logging is not enabled
+    debug = logger.isEnabledFor(logging.DEBUG)
 
     for resource in resources:
         if not check_all and resource.id not in ids:
-            logger.debug("`%s` resource will not be checked", resource.id)
+            if debug:
+                logger.debug("`%s` resource will not be checked", resource.id)
             continue
         elif resource.id in skip:
-            logger.debug("`%s` resource will be skipped", resource.id)
+            if debug:
+                logger.debug("`%s` resource will be skipped", resource.id)
+            continue
+        elif selected and not selected(resource):
+            if debug:
+                logger.debug("`%s` resource will be skipped", resource.id)
             continue
-        elif check_all:
-            # applied select option to filter
-            for key, value in (select or {}).items():
-                if getattr(resource, key, None) != value:
-                    logger.debug("`%s` resource will be skipped", resource.id)
-                    continue
 
         yield resource
 
@@ -229,10 +352,11 @@ def _create_title(resource, results):
 
 
 def nagios_output(resource, results):
-    """Convert checks results to nagios format."""
-    messages = os.linesep.join(results.messages)
-    title = _create_title(resource, results)
-    output = "{}{}{}".format(title, os.linesep, messages)
+    """Convert checks results to nagios format.
+
+    Nagios expects LF as line separator regardless of the platform.
+    """
+    output = "\n".join((_create_title(resource, results), *results.messages))
 
     # all checks passed
     if results.exit_code == NAGIOS_STATUS_OK:
@@ -265,7 +389,7 @@ def set_openstack_credentials(novarc):
     proc.communicate()
 
 
-def mechanism_skip_ids(connection, resource_type) -> List[str]:
+def mechanism_skip_ids(connection, resource_type, resources) -> List[str]:
     """Return list of openstack resource IDs.which will be skipped.
 
     The IDs are skipped due to OpenStack mechanism.
@@ -279,14 +403,13 @@ def mechanism_skip_ids(connection, resource_type) -> List[str]:
         ]
         skip_ids += localport_ids
         # Skip unbound ports
-        all_ports = RESOURCES[resource_type](connection)
-        for port in all_ports:
+        for port in resources:
             if port.status == "DOWN" and port.binding_vif_type == "unbound":
                 skip_ids.append(port.id)
     return skip_ids
 
 
-def mechanism_warning_ids(connection, resource_type) -> Dict[str, str]:
+def mechanism_warning_ids(connection, resource_type, resources) -> Dict[str, str]:
     """Return openstack resource which should throw out warning.
 
     The function will query resources which should be judged as warning status
@@ -303,8 +426,7 @@ def mechanism_warning_ids(connection, resource_type) -> Dict[str, str]:
 
     if resource_type == "port":
         # Move DOWN ports from CRITICAL to warning if the instance was shutoff
-        all_ports = RESOURCES[resource_type](connection)
-        for port in all_ports:
+        for port in resources:
             try:
                 if port.status == "DOWN":
                     server = connection.compute.get_server(port.device_id)
@@ -320,9 +442,17 @@ def mechanism_warning_ids(connection, resource_type) -> Dict[str, str]:
     return warn_ids
 
 
-def check(resource_type, ids, skip=None, select=None, check_all=False):
-    """Check OpenStack resource.
+@functools.lru_cache(maxsize=None)
+def get_connection():
+    """Get OpenStack connection, which is created only once and then reused."""
+    return openstack.connect(cloud="envvars")
+
+
+def _check_resource(connection, resource_type, ids, skip=None, select=None, check_all=False):
+    """Check OpenStack resource and return results.
 
+    :param connection: OpenStack connection
+    :type connection: openstack.connection.Connection
     :param resource_type: OpenStack resource type
     :type resource_type: str
     :param ids: OpenStack resource IDs that will be checked
@@ -333,28 +463,30 @@ def check(resource_type, ids, skip=None, select=None, check_all=False):
     :type select: Dict[str, str]
     :param check_all: flag to checking all OpenStack resources
     :type check_all: bool
-    :raise nagios_plugin3.UnknownError: if resource not valid status
-    :raise nagios_plugin3.CriticalError: if resource not found
-    :raise nagios_plugin3.CriticalError: if resource status is DOWN
+    :returns: results of the check
+    :rtype: Results
     """
     results = Results()
-    connection = openstack.connect(cloud="envvars")
-    resources = RESOURCES[resource_type](connection)
-    skip = skip or set()
+    ids = set(ids)
+    # resources are fetched only once, since they are used also by mechanism functions
+    resources = list(RESOURCES[resource_type](connection, ids, select))
+    skip = set(skip or ())
     skip.update(
         mechanism_skip_ids(
             connection=connection,
             resource_type=resource_type,
+            resources=resources,
         )
     )
     warn_ids: Dict[str, str] = mechanism_warning_ids(
         connection=connection,
         resource_type=resource_type,
+        resources=resources,
     )
-    checked_ids = []
+    checked_ids = set()
 
     for resource in _resource_filter(resources, ids, skip, check_all, select):
-        checked_ids.append(resource.id)
+        checked_ids.add(resource.id)
         if resource.id in warn_ids:
             results.add_result(resource_type, resource.id, warn_ids[resource.id], warn=True)
         elif resource_type not in RESOURCES_BY_EXISTENCE:
@@ -364,12 +496,32 @@ def check(resource_type, ids, skip=None, select=None, check_all=False):
             results.add_result(resource_type, resource.id)
 
     # Output the msg for input ids
-    for id_ in ids:
-        if id_ in skip:
-            results.add_result(resource_type, id_, skip=True)
-        elif id_ not in checked_ids:
-            results.add_result(resource_type, id_, exists=False)
+    for id_ in ids & skip:
+        results.add_result(resource_type, id_, skip=True)
+    for id_ in ids - skip - checked_ids:
+        results.add_result(resource_type, id_, exists=False)
+
+    return results
+
+
+def check(resource_type, ids, skip=None, select=None, check_all=False):
+    """Check OpenStack resource.
 
+    :param resource_type: OpenStack resource type
+    :type resource_type: str
+    :param ids: OpenStack resource IDs that will be checked
+    :type ids: Set[str]
+    :param skip: OpenStack resource IDs that will be skipped
+    :type skip: Set[str]
+    :param select: values for OpenStack resources filtering
+    :type select: Dict[str, str]
+    :param check_all: flag to checking all OpenStack resources
+    :type check_all: bool
+    :raise nagios_plugin3.UnknownError: if resource not valid status
+    :raise nagios_plugin3.CriticalError: if resource not found
+    :raise nagios_plugin3.CriticalError: if resource status is DOWN
+    """
+    results = _check_resource(get_connection(), resource_type, ids, skip, select, check_all)
     nagios_output(resource_type, results)
 
 
@@ -3,11 +3,15 @@
 import collections
 import configparser
 import glob
+import json
 import os
 import pwd
 import re
 import subprocess
-from urllib.parse import urlparse
+import threading
+import time
+from functools import cached_property
+from types import SimpleNamespace
 
 
 from charmhelpers import fetch
@@ -39,6 +43,64 @@ os.environ["REQUESTS_CA_BUNDLE"] = "/etc/ssl/certs/ca-certificates.crt"
 # files.plugins.check_resources
 RESOURCES_CHECKS_BY_EXISTENCE = ["security-group", "subnet", "network"]
 RESOURCES_CHECKS_WITH_STATUS = ["server", "floating-ip", "port"]
+CHECK_HTTP = "/usr/lib/nagios/plugins/check_http"
+# http(s)://host[:port][/path], where host could be IPv6 address in brackets
+ENDPOINT_URL_REGEX = re.compile(
+    r"^(?P<scheme>https?)://(?:\[(?P<ipv6>[^\]]+)\]|(?P<host>[^:/?#]+))(?::(?P<port>\d+))?"
+    r"(?:[/?#].*)?$"
+)
+# attributes required in os-credentials config option
+OS_CREDENTIALS_COMMON_ATTRS = (
+    "username",
+    "password",
+    "region_name",
+    "auth_url",
+    "credentials_project",
+    "volume_api_version",
+)
+OS_CREDENTIALS_V3_ATTRS = ("domain",)
+# keystone catalog is cached on disk, since it's changed rarely
+KEYSTONE_CATALOG_CACHE_TTL = 3600
+KEYSTONE_CATALOG_CACHE_ATTRS = [
+    "id",
+    "name",
+    "enabled",
+    "interface",
+    "url",
+    "service_id",
+    # v2 endpoints
+    "adminurl",
+    "internalurl",
+    "publicurl",
+]
+# keystone sessions shared across clients, keyed by auth plugin and credentials
+_keystone_sessions = {}
+_keystone_sessions_lock = threading.Lock()
+
+
+def get_keystone_session(auth_plugin, auth_creds):
+    """Return a keystone session shared by all clients with the same credentials.
+
+    The session keeps a pool of HTTP connections and the auth token, so they
+    are reused until the token expires instead of being created for each client.
+
+    :param auth_plugin: keystoneclient identity module, e.g. `keystoneclient.auth.identity.v3`
+    :param auth_creds: arguments for the auth plugin Password object
+    :type auth_creds: Dict[str, str]
+    :returns: keystoneclient Session object
+    """
+    key = (auth_plugin.__name__, tuple(sorted(auth_creds.items())))
+    with _keystone_sessions_lock:
+        if key not in _keystone_sessions:
+            sess = session.Session(auth=auth_plugin.Password(**auth_creds))
+            adapter = session.TCPKeepAliveAdapter(
+                pool_connections=10, pool_maxsize=20, max_retries=0
+            )
+            sess.session.mount("http://", adapter)
+            sess.session.mount("https://", adapter)
+            _keystone_sessions[key] = sess
+
+        return _keystone_sessions[key]
 
 
 class OSCCredentialsError(Exception):
@@ -127,6 +189,11 @@ class OSCHelper:
         """Define path to novarc config file for checks."""
         return "/var/lib/nagios/nagios.novarc"
 
+    @property
+    def keystone_catalog_cache(self):
+        """Define path to file with cached keystone endpoints and services."""
+        return "/var/lib/nagios/osc_catalog.json"
+
     @property
     def contrail_analytics_vip(self):
         """Expose the contrail_analytics_vip charm config value."""
@@ -195,45 +262,44 @@ class OSCHelper:
         else:
             return schedule.strip()
 
-    def get_os_credentials(self):
+    @cached_property
+    def os_credentials(self):
+        """Parse keystone credentials from the os-credentials config option.
+
+        The result is cached for the lifetime of the helper, which is created
+        for each hook execution, when charm config can not change.
+        """
         ident_creds = config_flags_parser(self.charm_config["os-credentials"])
         if not ident_creds.get("auth_url"):
             raise OSCCredentialsError("auth_url")
-        elif "/v3" in ident_creds.get("auth_url"):
-            extra_attrs = ["domain"]
-            creds = {"auth_version": 3}
-        else:
-            extra_attrs = []
-            creds = {}
-
-        common_attrs = (
-            "username password region_name auth_url" " credentials_project volume_api_version"
-        ).split()
-        all_attrs = common_attrs + extra_attrs
-        missing = [k for k in all_attrs if k not in ident_creds]
+
+        is_v3 = "/v3" in ident_creds["auth_url"]
+        required_attrs = OS_CREDENTIALS_COMMON_ATTRS
+        if is_v3:
+            required_attrs += OS_CREDENTIALS_V3_ATTRS
+
+        missing = [k for k in required_attrs if k not in ident_creds]
         if missing:
             raise OSCCredentialsError(", ".join(missing))
 
-        ident_creds["auth_url"] = ident_creds["auth_url"].strip("\"'")
-        creds.update(
-            dict(
-                [
-                    (k, ident_creds.get(k))
-                    for k in all_attrs
-                    if k not in ("credentials_project", "domain")
-                ]
-            )
-        )
-        if extra_attrs:
+        project = ident_creds["credentials_project"]
+        creds = {
+            "username": ident_creds["username"],
+            "password": ident_creds["password"],
+            "region_name": ident_creds["region_name"],
+            "auth_url": ident_creds["auth_url"].strip("\"'"),
+            "volume_api_version": ident_creds["volume_api_version"],
+        }
+        if is_v3:
+            domain = ident_creds["domain"]
             creds.update(
-                {
-                    "project_name": ident_creds["credentials_project"],
-                    "user_domain_name": ident_creds["domain"],
-                    "project_domain_name": ident_creds["domain"],
-                }
+                auth_version=3,
+                project_name=project,
+                user_domain_name=domain,
+                project_domain_name=domain,
             )
         else:
-            creds["tenant_name"] = ident_creds["credentials_project"]
+            creds["tenant_name"] = project
 
         return creds
 
@@ -673,31 +739,36 @@ class OSCHelper:
         for resource in RESOURCES_CHECKS_WITH_STATUS:
             self._render_resources_check_by_status(nrpe, resource)
 
-        nrpe.write()
-        self.create_endpoint_checks()
+        # write all checks at once, even if Keystone catalog could not be read
+        try:
+            self.create_endpoint_checks(nrpe=nrpe)
+        finally:
+            nrpe.write()
 
-    def _split_url(self, netloc, scheme):
-        """Split URL and return host and port tuple.
+    def _split_url(self, url):
+        """Split URL and return scheme, host and port tuple.
 
-        http(s)://host:port or http(s)://host will return a host and a port
+        http(s)://host:port or http(s)://host will return a scheme, a host and a port
 
         Even if a port is not specified, this helper will return a host and a port
-        (guessing it from the protocol used, if needed)
+        (guessing it from the protocol used, if needed). IPv6 address is returned
+        without brackets.
 
-        :param netloc: network location part as returned by urllib.urlparse
-        :type netloc: str
-        :param scheme: URL scheme specifier as returned by urllib.urlparse
-        :returns: str
-        :rtype: Tuple[str, str]
+        :param url: endpoint URL
+        :type url: str
+        :returns: scheme, host and port or None if URL is not valid http(s) URL
+        :rtype: Optional[Tuple[str, str, Union[str, int]]]
         """
-        if netloc.find(":") == -1:
+        match = ENDPOINT_URL_REGEX.match(url)
+        if not match:
+            return None
+
+        scheme, ipv6, host, port = match.group("scheme", "ipv6", "host", "port")
+        if not port:
             # no port specified
-            host = netloc
             port = 80 if scheme == "http" else 443
-        else:
-            host, port = netloc.split(":")
 
-        return host, port
+        return scheme, ipv6 or host, port
 
     def _configure_check_ssl_cert_options(self):
         """Configure check_ssl_cert_options."""
@@ -722,13 +793,8 @@ class OSCHelper:
         if kwargs.get("enabled", True) and self.charm_config.get(
             "check_{}_urls".format(interface)
         ):
-            command = "{} -H {} -p {} -u {} {}".format(
-                "/usr/lib/nagios/plugins/check_http",
-                host,
-                port,
-                url,
-                kwargs.get("check_http_options", ""),
-            )
+            check_http_options = kwargs.get("check_http_options", "")
+            command = f"{CHECK_HTTP} -H {host} -p {port} -u {url} {check_http_options}"
             nrpe.add_check(
                 shortname=kwargs.get("shortname", "check_http"),
                 description=kwargs.get("description", "Added nrpe check for http endpoint."),
@@ -744,14 +810,13 @@ class OSCHelper:
         if kwargs.get("enabled", True) and self.charm_config.get(
             "check_{}_urls".format(interface)
         ):
-            command = "{} -H {} -p {} -u {} -c {} -w {} {}".format(
-                os.path.join(self.plugins_dir, "check_ssl_cert"),
-                host,
-                port,
-                url,
-                self.charm_config.get("tls_crit_days", 14),
-                self.charm_config.get("tls_warn_days", 30),
-                kwargs.get("check_ssl_cert_options", ""),
+            check_ssl_cert = os.path.join(self.plugins_dir, "check_ssl_cert")
+            tls_crit_days = self.charm_config.get("tls_crit_days", 14)
+            tls_warn_days = self.charm_config.get("tls_warn_days", 30)
+            check_ssl_cert_options = kwargs.get("check_ssl_cert_options", "")
+            command = (
+                f"{check_ssl_cert} -H {host} -p {port} -u {url} "
+                f"-c {tls_crit_days} -w {tls_warn_days} {check_ssl_cert_options}"
             )
             nrpe.add_check(
                 shortname=kwargs.get("shortname", "check_ssl_cert"),
@@ -771,7 +836,7 @@ class OSCHelper:
                 continue
             return v3_interface, getattr(endpoint, v2_interface_url_name)
 
-    def create_endpoint_checks(self, creds=None):
+    def create_endpoint_checks(self, creds=None, nrpe=None):
         """
         Create an NRPE check for each Keystone catalog endpoint.
 
@@ -779,6 +844,8 @@ class OSCHelper:
         If there is a healthcheck endpoint for the API, use that URL, otherwise check
         the url '/'.
         If SSL, add a check for the cert.
+        If an NRPE object is provided, checks are added to it and the caller is
+        responsible for writing them, otherwise they are written right away.
 
         v2 endpoint needs the 'interface' attribute:
         <Endpoint {'id': 'XXXXX', 'region': 'RegionOne',
@@ -809,10 +876,17 @@ class OSCHelper:
         }
 
         self.get_keystone_client(creds)
-        nrpe = NRPE()
+        write_checks = nrpe is None
+        if write_checks:
+            nrpe = NRPE()
+
+        # NOTE: each access to the property lists endpoints and services from Keystone
+        endpoint_service_names = self.endpoint_service_names
+        # configured once, when the first https endpoint is found
+        check_ssl_cert_options = None
 
         for endpoint in self.keystone_endpoints:
-            service_name = self.endpoint_service_names[endpoint.id]
+            service_name = endpoint_service_names[endpoint.id]
             endpoint.healthcheck_url = health_check_params.get(service_name, "/")
 
             # Note(aluria): glance-simplestreams-sync does not provide an API to check
@@ -826,58 +900,54 @@ class OSCHelper:
                     continue
                 endpoint.interface, endpoint.url = self._normalize_endpoint_attr(endpoint)
 
-            check_url = urlparse(endpoint.url)
-            host, port = self._split_url(check_url.netloc, check_url.scheme)
+            split_url = self._split_url(endpoint.url)
+            if split_url is None:
+                hookenv.log(
+                    "Unsupported URL {} of endpoint {}".format(endpoint.url, endpoint.id),
+                    hookenv.WARNING,
+                )
+                continue
+
+            scheme, host, port = split_url
+            interface = endpoint.interface
 
-            check_http_options = []
-            if check_url.scheme == "https":
+            check_http_options = ""
+            if scheme == "https":
                 url = endpoint.healthcheck_url.strip().split(" ")[0]
-                nrpe_shortname = "{}_{}_cert".format(service_name, endpoint.interface)
-                check_ssl_cert_options = self._configure_check_ssl_cert_options()
+                if check_ssl_cert_options is None:
+                    check_ssl_cert_options = self._configure_check_ssl_cert_options()
 
                 self._render_https_endpoint_checks(
                     url=url,
                     host=host,
                     port=port,
                     nrpe=nrpe,
-                    shortname=nrpe_shortname,
-                    interface=endpoint.interface,
-                    description="Certificate expiry check for {} {}".format(
-                        service_name, endpoint.interface
-                    ),
-                    create_log="Added nrpe cert expiry check for: {}, {}".format(
-                        service_name, endpoint.interface
-                    ),
-                    remove_log="Removed nrpe cert expiry check for: {}, {}".format(
-                        service_name, endpoint.interface
-                    ),
+                    shortname=f"{service_name}_{interface}_cert",
+                    interface=interface,
+                    description=f"Certificate expiry check for {service_name} {interface}",
+                    create_log=f"Added nrpe cert expiry check for: {service_name}, {interface}",
+                    remove_log=f"Removed nrpe cert expiry check for: {service_name}, {interface}",
                     check_ssl_cert_options=check_ssl_cert_options,
                     enabled=endpoint.enabled,
                 )
-                check_http_options.append("-S")
+                check_http_options = "-S"
 
-            nrpe_shortname = "{}_{}".format(service_name, endpoint.interface)
             self._render_http_endpoint_checks(
                 url=endpoint.healthcheck_url,
                 host=host,
                 port=port,
                 nrpe=nrpe,
-                interface=endpoint.interface,
-                shortname=nrpe_shortname,
-                description="Endpoint url check for {} {}".format(
-                    service_name, endpoint.interface
-                ),
-                create_log="Added nrpe http endpoint check for {}, {}".format(
-                    service_name, endpoint.interface
-                ),
-                remove_log="Removed nrpe http endpoint check for {}, {}".format(
-                    service_name, endpoint.interface
-                ),
-                check_http_options="".join(check_http_options),
+                interface=interface,
+                shortname=f"{service_name}_{interface}",
+                description=f"Endpoint url check for {service_name} {interface}",
+                create_log=f"Added nrpe http endpoint check for {service_name}, {interface}",
+                remove_log=f"Removed nrpe http endpoint check for {service_name}, {interface}",
+                check_http_options=check_http_options,
                 enabled=endpoint.enabled,
             )
 
-        nrpe.write()
+        if write_checks:
+            nrpe.write()
 
     def get_keystone_client(self, creds):
         """Import the appropriate Keystone client depending on API version.
@@ -912,8 +982,7 @@ class OSCHelper:
             auth_fields = "username password auth_url tenant_name".split()
 
         auth_creds = dict([(key, creds.get(key)) for key in auth_fields])
-        auth = kst_version.Password(**auth_creds)
-        sess = session.Session(auth=auth)
+        sess = get_keystone_session(kst_version, auth_creds)
         self._keystone_client = client.Client(session=sess)
 
         if self._keystone_client is None:
@@ -923,30 +992,70 @@ class OSCHelper:
 
     @property
     def keystone_endpoints(self):
-        endpoints = self._safe_keystone_client_list("endpoints")
+        endpoints = self._cached_keystone_client_list("endpoints")
         hookenv.log("Endpoints from keystone: {}".format(endpoints))
         return endpoints
 
     @property
     def keystone_services(self):
-        services = self._safe_keystone_client_list("services")
+        services = self._cached_keystone_client_list("services")
         hookenv.log("Services from keystone: {}".format(services))
         return services
 
-    @property
-    def keystone_enabled_services(self):
-        enabled_services = [svc for svc in self.keystone_services if svc.enabled]
-        return enabled_services
-
     @property
     def endpoint_service_names(self):
-        endpoint_service_names = dict()
-        for endpoint in self.keystone_endpoints:
-            for svc in self.keystone_enabled_services:
-                if svc.id == endpoint.service_id:
-                    endpoint_service_names[endpoint.id] = svc.name
-                    continue
-        return endpoint_service_names
+        service_names = {svc.id: svc.name for svc in self.keystone_services if svc.enabled}
+        return {
+            endpoint.id: service_names[endpoint.service_id]
+            for endpoint in self.keystone_endpoints
+            if endpoint.service_id in service_names
+        }
+
+    def _read_keystone_catalog_cache(self):
+        try:
+            with open(self.keystone_catalog_cache, "r") as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return {}
+
+    def _cached_keystone_client_list(self, object_type):
+        """List keystone objects, using the on-disk cache if it's not expired.
+
+        Only successful responses are cached, errors are always raised.
+        """
+        cached = self._read_keystone_catalog_cache().get(object_type)
+        if cached and time.time() - cached["timestamp"] < KEYSTONE_CATALOG_CACHE_TTL:
+            return [SimpleNamespace(**item) for item in cached["items"]]
+
+        response = self._safe_keystone_client_list(object_type)
+        items = [
+            {
+                attr: getattr(obj, attr)
+                for attr in KEYSTONE_CATALOG_CACHE_ATTRS
+                if hasattr(obj, attr)
+            }
+            for obj in response
+        ]
+        catalog = self._read_keystone_catalog_cache()
+        catalog[object_type] = {"timestamp": time.time(), "items": items}
+        tmp_file = "{}.tmp".format(self.keystone_catalog_cache)
+        try:
+            with open(tmp_file, "w") as fd:
+                json.dump(catalog, fd)
+            os.replace(tmp_file, self.keystone_catalog_cache)
+        except OSError as error:
+            hookenv.log(
+                "Unable to cache keystone {}: {}".format(object_type, error), hookenv.WARNING
+            )
+
+        return response
+
+    def clear_keystone_catalog_cache(self):
+        """Remove cached keystone endpoints and services."""
+        try:
+            os.remove(self.keystone_catalog_cache)
+        except OSError:
+            pass
 
     def _safe_keystone_client_list(self, object_type):
         list_command = getattr(self._keystone_client, object_type).list
@@ -110,6 +110,7 @@ def save_creds(keystone):
     )
 
     helper.store_keystone_credentials(creds)
+    helper.clear_keystone_catalog_cache()
     set_flag("openstack-service-checks.stored-creds")
     clear_flag("openstack-service-checks.configured")
 
@@ -168,7 +169,7 @@ def get_credentials():
     keystonecreds relation data.
     """
     try:
-        creds = helper.get_os_credentials()
+        creds = helper.os_credentials
     except OSCCredentialsError as error:
         creds = helper.get_keystone_credentials()
         if not creds:
@@ -264,6 +265,7 @@ def configure_nrpe_endpoints():
 @when("identity-notifications.available.updated")
 def endpoints_changed():
     """Clear configured flag if endpoints are updated."""
+    helper.clear_keystone_catalog_cache()
     clear_flag("openstack-service-checks.endpoints.configured")
     clear_flag("openstack-service-checks.configured")
 
@@ -299,6 +301,7 @@ def do_reconfigure_nrpe():
 
     if any_flags_set(*flags):
         if is_flag_set(os_credentials_flag):
+            helper.clear_keystone_catalog_cache()
             clear_flag("openstack-service-checks.configured")
         clear_flag("openstack-service-checks.endpoints.configured")
 
@@ -147,6 +147,10 @@ def openstackservicechecks(tmpdir, mock_hookenv_config, mock_charm_dir, monkeypa
     from lib_openstack_service_checks import OSCHelper
 
     helper = OSCHelper()
+    monkeypatch.setattr(
+        "lib_openstack_service_checks.OSCHelper.keystone_catalog_cache",
+        str(tmpdir.join("osc_catalog.json")),
+    )
 
     # Any other functions that load helper will get this version
     monkeypatch.setattr("lib_openstack_service_checks.hookenv.log", lambda msg, level="INFO": None)
@@ -1,15 +1,35 @@
 """Test resources nagios check script."""
 
+import logging
 import os
 import sys
 import tempfile
 from unittest import mock
 from unittest.mock import MagicMock
 
-from check_resources import Results, check, parse_arguments, set_openstack_credentials
+from check_resources import (
+    FLOATING_IP_RESOURCES,
+    ID_FILTER_BATCH_SIZE,
+    PORT_RESOURCES,
+    RESOURCES,
+    Results,
+    _fetch,
+    _resource_filter,
+    check,
+    get_connection,
+    parse_arguments,
+    set_openstack_credentials,
+)
 
 from nagios_plugin3 import CriticalError, WarnError
 
+from openstack.network.v2.floating_ip import FloatingIP
+from openstack.network.v2.network import Network
+from openstack.network.v2.port import Port
+from openstack.network.v2.security_group import SecurityGroup
+from openstack.network.v2.subnet import Subnet
+from openstack.resource import QueryParameters
+
 import pytest
 
 
@@ -70,6 +90,12 @@ class FakeFloatingIPResource(FakeResource):
         return self._fixed_ip_address
 
 
+@pytest.fixture(autouse=True)
+def clear_connection_cache():
+    """Make sure each test creates its own OpenStack connection."""
+    get_connection.cache_clear()
+
+
 @pytest.mark.parametrize(
     "cli_args,exp_output",
     [
@@ -151,10 +177,10 @@ def test_check_passed(servers, check_kwargs, exp_ids):
         mock_conn.compute.servers.return_value = servers
         with mock.patch("check_resources.print") as mock_print:
             check("server", **check_kwargs)
-            messages = os.linesep.join(
+            messages = "\n".join(
                 "server '{}' is in ACTIVE status" "".format(_id) for _id in exp_ids
             )
-            output = "servers {0}/{0} passed{1}{2}" "".format(len(exp_ids), os.linesep, messages)
+            output = "servers {0}/{0} passed\n{1}" "".format(len(exp_ids), messages)
             mock_print.assert_called_once_with("OK: ", output)
 
 
@@ -170,20 +196,33 @@ def test_check_passed_by_existence(subnets, ids):
     subnets = [FakeResource("subnet", **subnet) for subnet in subnets]
     with mock.patch("check_resources.openstack") as openstack:
         openstack.connect.return_value = mock_conn = MagicMock()
-        mock_conn.network.subnets.return_value = subnets
+        mock_conn.network.subnets.side_effect = conn_list_returns(subnets)
         with mock.patch("check_resources.print") as mock_print:
             check("subnet", ids=ids)
-            messages = os.linesep.join("subnet '{}' exists".format(_id) for _id in ids)
-            output = "subnets {0}/{0} passed{1}{2}" "".format(len(ids), os.linesep, messages)
+            messages = "\n".join("subnet '{}' exists".format(_id) for _id in ids)
+            output = "subnets {0}/{0} passed\n{1}" "".format(len(ids), messages)
             mock_print.assert_called_once_with("OK: ", output)
 
 
+class OldNetwork(Network):
+    """Network resource of older OpenStack SDK, which does not support `fields`."""
+
+    _query_mapping = QueryParameters("name", "status")
+
+
+def conn_list_returns(resources):
+    def _conn_list_returns(id=None, **kwargs):
+        return [resource for resource in resources if id is None or resource.id in id]
+
+    return _conn_list_returns
+
+
 def conn_network_port_returns(ports):
     def _conn_network_port_returns(*args, **kwargs):
         if kwargs.get("device_owner") in ["network:dhcp", "network:distributed"]:
             for port in ports:
                 return [port for port in ports if port.device_owner == kwargs.get("device_owner")]
-        return ports
+        return conn_list_returns(ports)(**kwargs)
 
     return _conn_network_port_returns
 
@@ -194,7 +233,10 @@ def conn_network_ips_returns(ips):
         for ip in ips:
             check = True
             for k, v in kwargs.items():
-                if not getattr(ip, k) == v:
+                if k == "id" and ip.id not in v:
+                    check = False
+                    break
+                if k not in ["fields", "id"] and not getattr(ip, k) == v:
                     check = False
                     break
             if check:
@@ -245,6 +287,25 @@ def test_check_port_return(capsys, ports, exp_out):
         assert captured.out.startswith(exp_out)
 
 
+def test_check_port_fetched_once():
+    """Test that ports are listed once and filtered by IDs on the server side."""
+    ports = [FakePortResource("port", id_=str(i), status="ACTIVE") for i in range(50)]
+
+    with mock.patch("check_resources.openstack") as openstack:
+        openstack.connect.return_value = mock_conn = MagicMock()
+        mock_conn.network.ports.side_effect = conn_network_port_returns(ports)
+        with mock.patch("check_resources.print"):
+            check("port", ids={port.id for port in ports})
+
+    mock_conn.network.get_port.assert_not_called()
+    # one list call for checked ports and one for each type of local ports
+    assert mock_conn.network.ports.call_count == 3
+    mock_conn.network.ports.assert_any_call(
+        id=sorted(port.id for port in ports),
+        fields=["id", "status", "device_id", "binding:vif_type"],
+    )
+
+
 @pytest.mark.parametrize(
     "ips,exp_out",
     [
@@ -475,3 +536,132 @@ def test_result__add_result():
     assert results.exit_code == 1
     assert results._messages == [(1, "msg123")]
     assert group == ["123"]
+
+
+def test_results_messages():
+    results = Results()
+    results._add_result("1", [], 0, "msg1")
+    results._add_result("2", [], 2, "msg2")
+    results._add_result("3", [], 0, "msg3")
+
+    assert results.messages == ["msg2", "msg3", "msg1"]
+    assert results.messages is results.messages
+
+    results._add_result("4", [], 1, "msg4")
+    assert results.messages == ["msg2", "msg4", "msg3", "msg1"]
+
+
+@pytest.mark.parametrize(
+    "ids, select, fields, exp_list_kwargs",
+    [
+        (set(), None, None, {}),
+        (set(), None, ["id"], {"fields": ["id"]}),
+        (set(), {"network_id": "net-1"}, ["id"], {"network_id": "net-1"}),
+        ({"2", "1"}, None, ["id"], {"id": ["1", "2"], "fields": ["id"]}),
+        ({"1"}, {"network_id": "net-1"}, ["id"], {"id": ["1"], "network_id": "net-1"}),
+    ],
+)
+def test_fetch_server_side_filter(ids, select, fields, exp_list_kwargs):
+    """Test that IDs, select values and fields are passed to the OpenStack SDK."""
+    list_resources = MagicMock()
+
+    list(_fetch(list_resources, Port, ids, select, fields))
+
+    list_resources.assert_called_once_with(**exp_list_kwargs)
+
+
+@pytest.mark.parametrize(
+    "ids, select, exp_list_kwargs",
+    [
+        (set(), None, {}),
+        ({"1"}, None, {}),
+        (set(), {"name": "net", "zone": "a"}, {"name": "net"}),
+    ],
+)
+def test_fetch_unsupported_query(ids, select, exp_list_kwargs):
+    """Test that query parameters are not passed to SDK that does not support them."""
+    list_resources = MagicMock()
+
+    list(_fetch(list_resources, OldNetwork, ids, select, fields=["id"]))
+
+    list_resources.assert_called_once_with(**exp_list_kwargs)
+
+
+def test_fetch_ids_in_batches():
+    """Test that IDs are requested in batches."""
+    ids = {"{:03}".format(i) for i in range(ID_FILTER_BATCH_SIZE * 2 + 1)}
+    list_resources = MagicMock(side_effect=lambda id, **_: id)
+
+    assert list(_fetch(list_resources, Port, ids)) == sorted(ids)
+    assert list_resources.call_count == 3
+
+
+@pytest.mark.parametrize(
+    "resource_type, list_method, resource_cls",
+    [
+        ("network", "networks", Network),
+        ("floating-ip", "ips", FloatingIP),
+        ("port", "ports", Port),
+        ("security-group", "security_groups", SecurityGroup),
+        ("subnet", "subnets", Subnet),
+    ],
+)
+def test_resources_query(resource_type, list_method, resource_cls):
+    """Test that listed resources are queried only with parameters known to the SDK."""
+    mock_conn = MagicMock()
+    RESOURCES[resource_type](mock_conn)
+    FLOATING_IP_RESOURCES["unassigned"](mock_conn)
+    for list_resources in PORT_RESOURCES.values():
+        list_resources(mock_conn)
+
+    for call in getattr(mock_conn.network, list_method).call_args_list:
+        resource_cls._query_mapping._validate(call.kwargs, resource_cls.base_path)
+
+
+def test_get_connection():
+    """Test that OpenStack connection is reused."""
+    with mock.patch("check_resources.openstack") as openstack:
+        assert get_connection() is get_connection()
+        openstack.connect.assert_called_once_with(cloud="envvars")
+
+
+@pytest.mark.parametrize(
+    "kwargs, exp_ids",
+    [
+        ({"ids": {"1", "3"}, "skip": None, "check_all": False, "select": None}, ["1", "3"]),
+        ({"ids": {"1", "3"}, "skip": {"3"}, "check_all": False, "select": None}, ["1"]),
+        ({"ids": set(), "skip": {"2"}, "check_all": True, "select": None}, ["1", "3"]),
+        ({"ids": set(), "skip": None, "check_all": True, "select": {"zone": "a"}}, ["1", "2"]),
+        (
+            {
+                "ids": set(),
+                "skip": {"1"},
+                "check_all": True,
+                "select": {"zone": "a", "network_id": "x"},
+            },
+            ["2"],
+        ),
+        ({"ids": set(), "skip": None, "check_all": True, "select": {"missing": "a"}}, []),
+    ],
+)
+def test_resource_filter(kwargs, exp_ids):
+    """Test filtering resources with `--id`, `--skip-id` and `--select`."""
+    resources = [
+        FakeResource("server", "1", zone="a", network_id="x"),
+        FakeResource("server", "2", zone="a", network_id="x"),
+        FakeResource("server", "3", zone="b", network_id="x"),
+    ]
+
+    assert [resource.id for resource in _resource_filter(resources, **kwargs)] == exp_ids
+
+
+@pytest.mark.parametrize("level, exp_calls", [(logging.DEBUG, 2), (logging.INFO, 0)])
+def test_resource_filter_debug_log(level, exp_calls):
+    """Test that skipped resources are logged only if debug logging is enabled."""
+    resources = [FakeResource("server", id_) for id_ in ["1", "2", "3"]]
+
+    with mock.patch("check_resources.logger") as mock_logger:
+        mock_logger.isEnabledFor.side_effect = lambda lvl: lvl >= level
+        list(_resource_filter(resources, set(), {"1", "2"}, True, None))
+
+    assert mock_logger.debug.call_count == exp_calls
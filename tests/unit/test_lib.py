@@ -1,5 +1,7 @@
 """Test helper library functions."""
 
+import time
+from types import SimpleNamespace
 from unittest import mock
 from unittest.mock import ANY, MagicMock, mock_open
 
@@ -9,10 +11,12 @@ import keystoneauth1
 
 from lib_openstack_service_checks import (
     OSCConfigError,
+    OSCCredentialsError,
     OSCHelper,
     OSCKeystoneClientError,
     OSCKeystoneServerError,
     OSCSslError,
+    get_keystone_session,
 )
 
 import pytest
@@ -89,7 +93,50 @@ def test_openstackservicechecks_get_keystone_credentials_oscredentials(
 ):
     """Check the expected behavior when keystone v2 and v3 data is set via config."""
     openstackservicechecks.charm_config["os-credentials"] = os_credentials
-    assert openstackservicechecks.get_os_credentials() == expected
+    assert openstackservicechecks.os_credentials == expected
+
+
+@pytest.mark.parametrize(
+    "os_credentials,exp_missing",
+    [
+        ("username=nagios", "auth_url"),
+        (
+            'username=nagios, auth_url="http://XX.XX.XX.XX:5000/v2.0", volume_api_version=3',
+            "password, region_name, credentials_project",
+        ),
+        (
+            "username=nagios, password=password, region_name=RegionOne, "
+            'auth_url="http://XX.XX.XX.XX:5000/v3", credentials_project=services, '
+            "volume_api_version=3",
+            "domain",
+        ),
+    ],
+)
+def test_openstackservicechecks_os_credentials_missing(
+    os_credentials, exp_missing, openstackservicechecks
+):
+    """Check that missing os-credentials attributes are reported."""
+    openstackservicechecks.charm_config["os-credentials"] = os_credentials
+    with pytest.raises(OSCCredentialsError, match=exp_missing):
+        openstackservicechecks.os_credentials
+
+
+@mock.patch("lib_openstack_service_checks.config_flags_parser")
+def test_openstackservicechecks_os_credentials_cached(
+    mock_config_flags_parser, openstackservicechecks
+):
+    """Check that os-credentials config option is parsed only once."""
+    mock_config_flags_parser.return_value = {
+        "username": "nagios",
+        "password": "password",
+        "region_name": "RegionOne",
+        "auth_url": "http://XX.XX.XX.XX:5000/v2.0",
+        "credentials_project": "services",
+        "volume_api_version": "3",
+    }
+
+    assert openstackservicechecks.os_credentials is openstackservicechecks.os_credentials
+    mock_config_flags_parser.assert_called_once()
 
 
 @pytest.mark.parametrize(
@@ -133,6 +180,68 @@ def test_keystone_client_exceptions(
             openstackservicechecks.keystone_services
 
 
+def test_endpoint_service_names(openstackservicechecks):
+    """Test mapping of endpoints to the names of enabled services."""
+    services = [
+        SimpleNamespace(id="1", name="nova", enabled=True),
+        SimpleNamespace(id="2", name="glance", enabled=True),
+        SimpleNamespace(id="3", name="heat", enabled=False),
+    ]
+    endpoints = [
+        SimpleNamespace(id="endpoint-1", service_id="1"),
+        SimpleNamespace(id="endpoint-2", service_id="1"),
+        SimpleNamespace(id="endpoint-3", service_id="2"),
+        SimpleNamespace(id="endpoint-4", service_id="3"),
+    ]
+    mock_keystone_client = MagicMock()
+    mock_keystone_client.services.list.return_value = services
+    mock_keystone_client.endpoints.list.return_value = endpoints
+    openstackservicechecks._keystone_client = mock_keystone_client
+
+    assert openstackservicechecks.endpoint_service_names == {
+        "endpoint-1": "nova",
+        "endpoint-2": "nova",
+        "endpoint-3": "glance",
+    }
+    mock_keystone_client.services.list.assert_called_once_with()
+    mock_keystone_client.endpoints.list.assert_called_once_with()
+
+
+def test_keystone_catalog_cache(openstackservicechecks):
+    """Test that keystone endpoints are cached on disk."""
+    endpoint = SimpleNamespace(id="1", publicurl="http://10.0.0.1:9696", service_id="2")
+    mock_keystone_client = MagicMock()
+    mock_keystone_client.endpoints.list.return_value = [endpoint]
+    openstackservicechecks._keystone_client = mock_keystone_client
+
+    assert openstackservicechecks.keystone_endpoints == [endpoint]
+    assert openstackservicechecks.keystone_endpoints == [endpoint]
+    mock_keystone_client.endpoints.list.assert_called_once_with()
+
+    # expired cache
+    with mock.patch("lib_openstack_service_checks.time.time", return_value=time.time() + 3600):
+        assert openstackservicechecks.keystone_endpoints == [endpoint]
+    assert mock_keystone_client.endpoints.list.call_count == 2
+
+    openstackservicechecks.clear_keystone_catalog_cache()
+    assert openstackservicechecks.keystone_endpoints == [endpoint]
+    assert mock_keystone_client.endpoints.list.call_count == 3
+
+
+@mock.patch("lib_openstack_service_checks._keystone_sessions", new_callable=dict)
+def test_get_keystone_session(_):
+    """Test that keystone session is shared for the same credentials."""
+    auth_plugin = MagicMock(__name__="keystoneclient.auth.identity.v3")
+    auth_creds = {"username": "nagios", "password": "password"}
+
+    sess = get_keystone_session(auth_plugin, auth_creds)
+
+    assert get_keystone_session(auth_plugin, dict(auth_creds)) is sess
+    assert get_keystone_session(auth_plugin, {"username": "admin"}) is not sess
+    assert auth_plugin.Password.call_count == 2
+    assert sess.session.get_adapter("https://keystone:5000")._pool_maxsize == 20
+
+
 @pytest.mark.parametrize(
     "value, exp_ids", [("1,2,3,,4", ["1", "2", "3", "4"]), ("", []), ("all", ["all"])]
 )
@@ -507,6 +616,25 @@ def test__render_allocation_checks(
         nrpe.add_check.assert_not_called()
 
 
+@pytest.mark.parametrize(
+    "url, exp_result",
+    [
+        ("http://10.0.0.1", ("http", "10.0.0.1", 80)),
+        ("https://keystone.local/v3", ("https", "keystone.local", 443)),
+        ("http://10.0.0.1:9696", ("http", "10.0.0.1", "9696")),
+        ("https://10.0.0.1:5000/v3?a=b", ("https", "10.0.0.1", "5000")),
+        ("http://[fd00::1]:8774/v2.1", ("http", "fd00::1", "8774")),
+        ("https://[fd00::1]/", ("https", "fd00::1", 443)),
+        ("ftp://10.0.0.1", None),
+        ("10.0.0.1:9696", None),
+    ],
+)
+def test__split_url(url, exp_result):
+    """Test splitting endpoint URL to scheme, host and port."""
+    with mock.patch("charmhelpers.core.hookenv.config", return_value={}):
+        assert OSCHelper()._split_url(url) == exp_result
+
+
 @pytest.mark.parametrize("v3_interface", ["admin", "internal", "public"])
 def test__normalize_endpoint_attr(v3_interface):
     """Test normalize the attributes in service catalog endpoint between v2 and v3."""
@@ -692,6 +820,24 @@ def test_create_endpoint_checks__disabled_endpoint(
     mock_render_https.assert_called_with(**expected_args)
 
 
+@mock.patch("lib_openstack_service_checks.OSCHelper._render_http_endpoint_checks")
+@mock.patch("charmhelpers.core.hookenv.config", return_value={})
+def test_create_endpoint_checks__nrpe(mock_config, mock_render_http, mock_any_endpoint):
+    """Test that checks are written only if NRPE object was not provided."""
+    setattr(mock_any_endpoint, "interface", "public")
+    setattr(mock_any_endpoint, "url", "http://localhost/")
+    nrpe = MagicMock()
+
+    OSCHelper().create_endpoint_checks(nrpe=nrpe)
+    mock_render_http.assert_called_once()
+    assert mock_render_http.call_args.kwargs["nrpe"] is nrpe
+    nrpe.write.assert_not_called()
+
+    with mock.patch("lib_openstack_service_checks.NRPE") as mock_nrpe:
+        OSCHelper().create_endpoint_checks()
+        mock_nrpe.return_value.write.assert_called_once_with()
+
+
 @pytest.mark.parametrize("v2_interface_url", ["adminurl", "internalurl", "publicurl"])
 @mock.patch("lib_openstack_service_checks.OSCHelper._render_https_endpoint_checks")
 @mock.patch("lib_openstack_service_checks.OSCHelper._render_http_endpoint_checks")